@@ -0,0 +1,52 @@
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("selectolax")
+
+from weekly_agent import Config, WeeklyReportAgent
+
+
+BASE = "https://www.ecdc.europa.eu/en/publications-data/"
+
+
+@pytest.fixture
+def agent():
+    return WeeklyReportAgent(Config())
+
+
+def test_candidate_rank_uses_latest_year_for_cross_year_reports(agent):
+    url = BASE + "communicable-disease-threats-report-30-december-2024-5-january-2025-week-1"
+    assert agent._candidate_rank(url) == (2025, 1)
+
+
+def test_candidate_rank_orders_new_year_week_before_previous_december(agent):
+    candidates = [
+        BASE + "communicable-disease-threats-report-21-27-december-2024-week-52",
+        BASE + "communicable-disease-threats-report-30-december-2024-5-january-2025-week-1",
+        BASE + "communicable-disease-threats-report-archive",
+    ]
+    ranked = sorted(candidates, key=agent._candidate_rank, reverse=True)
+    assert ranked == [candidates[1], candidates[0], candidates[2]]
+
+
+def test_pdf_from_article_picks_first_pdf_link_case_insensitively(agent):
+    html = (
+        "<html><head><title>Week 3 2025</title></head><body>"
+        '<a href="/files/Report.PDF">report</a>'
+        '<a href="/files/annex.pdf">annex</a>'
+        "</body></html>"
+    )
+    _, pdf_url, week, year = agent._pdf_from_article(BASE + "article", html)
+    assert pdf_url == "https://www.ecdc.europa.eu/files/Report.PDF"
+    assert (week, year) == (3, 2025)
+
+
+def test_pdf_from_article_labels_cross_year_report_with_latest_year(agent):
+    html = (
+        "<html><head><title>Communicable disease threats report, "
+        "30 December 2024 - 5 January 2025, week 1</title></head><body>"
+        '<a href="/files/cdtr-2024-2025-week-1.pdf">report</a>'
+        "</body></html>"
+    )
+    _, _, week, year = agent._pdf_from_article(BASE + "article", html)
+    assert (week, year) == (1, 2025)
@@ -5,30 +5,27 @@ import os
 import re
 import ssl
 import json
-import time
+import hashlib
+import functools
+import importlib
+import shutil
+import string
 import smtplib
 import logging
 import tempfile
 import datetime as dt
-from typing import Dict, List, Tuple, Optional, Any
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Tuple, Optional, Any, Iterator
+from html import escape, unescape
 from urllib.parse import urljoin, unquote
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from selectolax.lexbor import LexborHTMLParser
 
-# PDF: extractor principal y respaldo
-try:
-    import pdfplumber  # type: ignore
-except Exception:
-    pdfplumber = None  # type: ignore
-
-try:
-    from PyPDF2 import PdfReader  # type: ignore
-except Exception:
-    PdfReader = None  # type: ignore
-
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+from email.message import EmailMessage
+from email.policy import SMTP as SMTP_POLICY
 
 
 # =====================================================================
@@ -51,6 +48,10 @@ class Config:
     log_level = os.getenv("LOG_LEVEL", "INFO")
     state_file = ".weekly_agent_state.json"
 
+    # Caché de texto extraído, indexada por hash del PDF
+    cache_dir = os.getenv("CACHE_DIR", ".weekly_agent_cache")
+    cache_max_entries = 8
+
     # Tamaño máximo del PDF (MB) por seguridad
     max_pdf_mb = int(os.getenv("MAX_PDF_MB", "30"))
 
@@ -67,300 +68,66 @@ MESES_ES = {
 def fecha_es(dt_utc: dt.datetime) -> str:
     return f"{dt_utc.day} de {MESES_ES.get(dt_utc.month, 'mes')} de {dt_utc.year}"
 
-def clean_spaces(s: str) -> str:
-    return re.sub(r"\s+", " ", s or "").strip()
-
-
-# =====================================================================
-# Agente con tu formato EXACTO
-# =====================================================================
-
-class WeeklyReportAgent:
-    def __init__(self, cfg: Config) -> None:
-        self.cfg = cfg
-        logging.basicConfig(
-            level=getattr(logging, cfg.log_level.upper(), logging.INFO),
-            format="%(asctime)s %(levelname)s %(message)s"
-        )
-        self.session = requests.Session()
-        self.session.headers.update({
-            "User-Agent": (
-                "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
-                "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
-            ),
-            "Accept": "text/html,application/xhtml+xml,application/pdf,*/*;q=0.8",
-        })
+# Expresiones usadas en cada página/frase, compiladas una sola vez
+_RE_SPACES = re.compile(r"\s+")
+_RE_SENT_BOUNDARY = re.compile(r"(?<=[\.\?!;])\s+(?=[A-Z0-9])")
 
-    # --------------------------------------------------------------
-    # Localización del artículo y PDF
-    # --------------------------------------------------------------
-    def _parse_week_year(self, text: str) -> Tuple[Optional[int], Optional[int]]:
-        s = unquote(text or "").lower()
-        w = re.search(r"\bweek[\s\-]?(\d{1,2})\b", s)
-        y = re.search(r"\b(20\d{2})\b", s)
-        return (int(w.group(1)) if w else None,
-                int(y.group(1)) if y else None)
-
-    def fetch_latest_article_and_pdf(self) -> Tuple[str, str, Optional[int], Optional[int]]:
-        """Devuelve (article_url, pdf_url, week, year)."""
-        r = self.session.get(self.cfg.list_url, timeout=30)
-        r.raise_for_status()
-        soup = BeautifulSoup(r.text, "html.parser")
-
-        # Candidatos: enlaces a "communicable-disease-threats-report-...-week-XX"
-        candidates: List[str] = []
-        for a in soup.find_all("a", href=True):
-            href = a["href"].strip()
-            l = href.lower()
-            if "communicable-disease-threats-report" in l and ("/publications-data/" in l or "/publications-and-data/" in l):
-                url = href if href.startswith("http") else urljoin("https://www.ecdc.europa.eu", href)
-                candidates.append(url)
-
-        if not candidates:
-            raise RuntimeError("No se encontraron artículos CDTR en la página de listados.")
-
-        # Recorremos por orden de aparición (la página ya ordena por recencia)
-        for article_url in candidates:
-            ar = self.session.get(article_url, timeout=30)
-            if ar.status_code != 200:
-                continue
-            asoup = BeautifulSoup(ar.text, "html.parser")
-
-            # En el artículo suele existir un enlace directo a PDF (primer <a> .pdf)
-            pdf_a = asoup.find("a", href=re.compile(r"\.pdf$", re.I))
-            if not pdf_a:
-                # A veces el PDF usa espacios codificados u otros sufijos; probamos
-                for a in asoup.find_all("a", href=True):
-                    if ".pdf" in a["href"].lower():
-                        pdf_a = a
-                        break
-            if not pdf_a:
-                continue
-
-            pdf_url = pdf_a["href"]
-            if not pdf_url.startswith("http"):
-                pdf_url = urljoin(article_url, pdf_url)
-
-            # Semana/año
-            t = (asoup.title.get_text(strip=True) if asoup.title else "") + " " + pdf_url
-            week, year = self._parse_week_year(t)
-            logging.info("Artículo CDTR: %s", article_url)
-            logging.info("PDF CDTR: %s (semana=%s, año=%s)", pdf_url, week, year)
-            return article_url, pdf_url, week, year
-
-        raise RuntimeError("No se logró localizar un PDF dentro de los artículos candidatos.")
-
-    # --------------------------------------------------------------
-    # Estado (para no reenviar el mismo PDF)
-    # --------------------------------------------------------------
-    def _load_state(self) -> Dict:
-        if not os.path.exists(self.cfg.state_file):
-            return {}
-        try:
-            with open(self.cfg.state_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return {}
+def clean_spaces(s: str) -> str:
+    return _RE_SPACES.sub(" ", s or "").strip()
 
-    def _save_state(self, pdf_url: str) -> None:
-        state = {"last_pdf_url": pdf_url, "ts": dt.datetime.utcnow().isoformat()}
-        with open(self.cfg.state_file, "w", encoding="utf-8") as f:
-            json.dump(state, f)
+class PdfNotModified(Exception):
+    """El servidor respondió 304: el PDF ya enviado no ha cambiado."""
 
-    # --------------------------------------------------------------
-    # Descarga y extracción de texto del PDF
-    # --------------------------------------------------------------
-    def _download_pdf(self, pdf_url: str) -> str:
-        # Pre-chequeo tamaño
-        try:
-            h = self.session.head(pdf_url, timeout=15, allow_redirects=True)
-            clen = h.headers.get("Content-Length")
-            if clen and int(clen) > self.cfg.max_pdf_mb * 1024 * 1024:
-                raise RuntimeError(f"El PDF excede {self.cfg.max_pdf_mb} MB.")
-        except requests.RequestException:
-            pass
+# Artículos CDTR descargados en paralelo por bloque
+ARTICLE_WORKERS = 4
 
-        r = self.session.get(pdf_url, timeout=60, stream=True)
-        r.raise_for_status()
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-        with tmp as f:
-            for chunk in r.iter_content(8192):
-                if chunk:
-                    f.write(chunk)
-        return tmp.name
+# PDF: extractor principal (PyMuPDF) y respaldos (pypdfium2, pdfplumber, PyPDF2).
+# Se importan al primer uso: si no hay PDF nuevo no se paga su carga.
+@functools.lru_cache(maxsize=None)
+def _optional_import(name: str) -> Any:
+    try:
+        return importlib.import_module(name)
+    except Exception as e:
+        logging.debug("Módulo opcional %s no disponible: %s", name, e)
+        return None
 
-    def _extract_text_pdf(self, path: str) -> str:
-        # 1) pdfplumber (si está)
-        if pdfplumber is not None:
-            try:
-                text = []
-                with pdfplumber.open(path) as pdf:
-                    for p in pdf.pages:
-                        txt = p.extract_text() or ""
-                        # Normalizamos cortes de línea
-                        text.append(clean_spaces(txt.replace("\n", " ")))
-                return "\n".join(t for t in text if t.strip())
-            except Exception as e:
-                logging.warning("pdfplumber falló: %s", e)
+# Extracción paralela por páginas (solo para el respaldo pdfplumber)
+PDF_WORKERS = 4
+PDF_PARALLEL_MIN_PAGES = 8
 
-        # 2) PyPDF2
-        if PdfReader is not None:
-            try:
-                reader = PdfReader(path)
-                parts = []
-                for page in reader.pages:
-                    try:
-                        txt = page.extract_text() or ""
-                    except Exception:
-                        txt = ""
-                    if txt:
-                        parts.append(clean_spaces(txt.replace("\n", " ")))
-                return "\n".join(parts)
-            except Exception as e:
-                logging.warning("PyPDF2 falló: %s", e)
+def _pdfplumber_pages(path: str, start: int, stop: int) -> List[str]:
+    """Texto normalizado de las páginas [start, stop) (se ejecuta en otro proceso)."""
+    pdfplumber = _optional_import("pdfplumber")
+    with pdfplumber.open(path, pages=list(range(start + 1, stop + 1))) as pdf:
+        return [clean_spaces((p.extract_text() or "").replace("\n", " ")) for p in pdf.pages]
 
-        return ""
 
-    # --------------------------------------------------------------
-    # Extracción de datos específicos
-    # --------------------------------------------------------------
-    def extract_report_data(self, text: str, week: Optional[int], year: Optional[int]) -> Dict[str, Any]:
-        """Extrae datos específicos manteniendo la estructura de tu ejemplo"""
-        # Valores por defecto basados en tu ejemplo exacto
-        data = {
-            # Metadatos
-            "week": week or 38,
-            "year": year or 2025,
-            "fecha_semana": f"13-19 Septiembre {year or 2025}",
-            "fecha_generacion": fecha_es(dt.datetime.utcnow()),
-            
-            # Resumen ejecutivo (se intentará extraer del PDF)
-            "resumen_ejecutivo": "Continúa la circulación generalizada de SARS-CoV-2 en la UE/EEA con impacto limitado en hospitalizaciones. Los virus respiratorios estacionales (VRS e influenza) se mantienen en niveles muy bajos. Se reportan avances en el brote de Ébola en República Democrática del Congo y alertas por rabia en Bangkok y virus Nipah en Bangladesh.",
-            
-            # Datos de España
-            "espana_cchf_acumulado": 3,
-            "espana_cchf_nuevos": 0,
-            "espana_paises_wnv": 11,
-            "espana_dengue_casos": 0,
-            
-            # Virus Respiratorios
-            "respiratorios_sars_primaria": "13%",
-            "respiratorios_sars_hospitalarios": "11%",
-            "respiratorios_influenza": "1.4%",
-            "respiratorios_vrs": "0%",
-            
-            # WNV
-            "wnv_paises": 11,
-            "wnv_areas": 120,
-            
-            # CCHF
-            "cchf_espana_casos": 3,
-            "cchf_grecia_casos": 2,
-            "cchf_nuevos_casos": 0,
-            
-            # Dengue
-            "dengue_francia": 21,
-            "dengue_italia": 4,
-            "dengue_portugal": 2,
-            "dengue_clusters": 4,
-            
-            # Chikungunya
-            "chikungunya_francia_casos": 480,
-            "chikungunya_italia_casos": 205,
-            "chikungunya_francia_clusters": 53,
-            "chikungunya_italia_clusters": 4,
-            "chikungunya_clusters_activos_francia": 38,
-            "chikungunya_clusters_activos_italia": 3,
-            
-            # Ébola
-            "ebola_casos_total": 48,
-            "ebola_confirmados": 38,
-            "ebola_probables": 10,
-            "ebola_muertes": 31,
-            "ebola_letalidad": "64.6%",
-            "ebola_vacunados": 591,
-            "ebola_contactos": 900,
-        }
-        
-        # Intenta extraer datos reales del texto si está disponible
-        if text:
-            sentences = self._split_sentences(text)
-            
-            # Búsqueda de patrones específicos
-            for sentence in sentences:
-                sentence_lower = sentence.lower()
-                
-                # Buscar porcentajes para respiratorios
-                if any(keyword in sentence_lower for keyword in ['sars-cov-2', 'covid', 'influenza', 'rsv']):
-                    percentages = re.findall(r'(\d+\.?\d*%)', sentence)
-                    if percentages:
-                        if len(percentages) >= 4:
-                            data.update({
-                                "respiratorios_sars_primaria": percentages[0],
-                                "respiratorios_sars_hospitalarios": percentages[1],
-                                "respiratorios_influenza": percentages[2],
-                                "respiratorios_vrs": percentages[3]
-                            })
-                
-                # Buscar números para WNV
-                if 'west nile' in sentence_lower or 'wnv' in sentence_lower:
-                    numbers = re.findall(r'\b(\d+)\b', sentence)
-                    if numbers and len(numbers) >= 2:
-                        data.update({
-                            "wnv_paises": int(numbers[0]),
-                            "wnv_areas": int(numbers[1])
-                        })
-                
-                # Buscar números para CCHF
-                if 'crimean-congo' in sentence_lower or 'cchf' in sentence_lower:
-                    numbers = re.findall(r'\b(\d+)\b', sentence)
-                    if numbers:
-                        if 'spain' in sentence_lower or 'espa' in sentence_lower:
-                            data["cchf_espana_casos"] = int(numbers[0]) if numbers else 3
-                        elif 'greece' in sentence_lower or 'grecia' in sentence_lower:
-                            data["cchf_grecia_casos"] = int(numbers[0]) if numbers else 2
-        
-        return data
-
-    def _split_sentences(self, text: str) -> List[str]:
-        raw = re.sub(r"\s+", " ", text).strip()
-        parts = re.split(r"(?<=[\.\?!;])\s+(?=[A-Z0-9])", raw)
-        return [p.strip() for p in parts if p.strip()]
-
-    # --------------------------------------------------------------
-    # TU FORMATO EXACTO - HTML IDÉNTICO AL QUE ME DISTE
-    # --------------------------------------------------------------
-    def build_html(self, week: Optional[int], year: Optional[int],
-                   pdf_url: str, article_url: str,
-                   report_data: Dict[str, Any]) -> str:
+# =====================================================================
+# Plantilla HTML (compilada una vez al importar el módulo)
+# =====================================================================
 
-        # Calcular fecha de generación
-        today = dt.datetime.utcnow()
-        fecha_generacion = f"{today.day} de {MESES_ES.get(today.month, 'septiembre')} de {today.year}"
-        
-        # TU HTML EXACTO con placeholders reemplazados
-        html_content = f"""<!DOCTYPE html>
+HTML_TEMPLATE = string.Template("""<!DOCTYPE html>
 <html lang="es">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Resumen Semanal ECDC - Semana {report_data['week']}</title>
+    <title>Resumen Semanal ECDC - Semana $week</title>
     <style>
-        * {{
+        * {
             margin: 0;
             padding: 0;
             box-sizing: border-box;
             font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-        }}
-        body {{
+        }
+        body {
             background-color: #f5f7fa;
             color: #333;
             line-height: 1.6;
             padding: 20px;
             max-width: 1200px;
             margin: 0 auto;
-        }}
-        .header {{
+        }
+        .header {
             text-align: center;
             padding: 20px;
             background: linear-gradient(135deg, #2b6ca3 0%, #1a4e7a 100%);
@@ -368,148 +135,148 @@ class WeeklyReportAgent:
             border-radius: 10px;
             margin-bottom: 25px;
             box-shadow: 0 4px 12px rgba(0, 0, 0, 0.1);
-        }}
-        .header h1 {{
+        }
+        .header h1 {
             font-size: 2.2rem;
             margin-bottom: 10px;
-        }}
-        .header .subtitle {{
+        }
+        .header .subtitle {
             font-size: 1.2rem;
             margin-bottom: 15px;
             opacity: 0.9;
-        }}
-        .header .week {{
+        }
+        .header .week {
             background-color: rgba(255, 255, 255, 0.2);
             display: inline-block;
             padding: 8px 16px;
             border-radius: 30px;
             font-weight: 600;
-        }}
-        .container {{
+        }
+        .container {
             display: grid;
             grid-template-columns: 1fr 1fr;
             gap: 20px;
-        }}
-        @media (max-width: 900px) {{
-            .container {{
+        }
+        @media (max-width: 900px) {
+            .container {
                 grid-template-columns: 1fr;
-            }}
-        }}
-        .card {{
+            }
+        }
+        .card {
             background: white;
             border-radius: 10px;
             padding: 20px;
             box-shadow: 0 4px 8px rgba(0, 0, 0, 0.05);
             transition: transform 0.3s ease;
-        }}
-        .card:hover {{
+        }
+        .card:hover {
             transform: translateY(-5px);
             box-shadow: 0 6px 12px rgba(0, 0, 0, 0.1);
-        }}
-        .card h2 {{
+        }
+        .card h2 {
             color: #2b6ca3;
             border-bottom: 2px solid #eaeaea;
             padding-bottom: 10px;
             margin-bottom: 15px;
             font-size: 1.4rem;
-        }}
-        .spain-card {{
+        }
+        .spain-card {
             border-left: 5px solid #c60b1e;
             background-color: #fff9f9;
-        }}
-        .spain-card h2 {{
+        }
+        .spain-card h2 {
             color: #c60b1e;
             display: flex;
             align-items: center;
-        }}
-        .spain-card h2:before {{
+        }
+        .spain-card h2:before {
             content: "🇪🇸";
             margin-right: 10px;
-        }}
-        .stat-grid {{
+        }
+        .stat-grid {
             display: grid;
             grid-template-columns: repeat(2, 1fr);
             gap: 15px;
             margin: 15px 0;
-        }}
-        .stat-box {{
+        }
+        .stat-box {
             background: #f8f9fa;
             padding: 15px;
             border-radius: 8px;
             text-align: center;
             border: 1px solid #eaeaea;
-        }}
-        .stat-box .number {{
+        }
+        .stat-box .number {
             font-size: 1.8rem;
             font-weight: bold;
             color: #2b6ca3;
             margin-bottom: 5px;
-        }}
-        .stat-box .label {{
+        }
+        .stat-box .label {
             font-size: 0.9rem;
             color: #666;
-        }}
-        .spain-stat .number {{
+        }
+        .spain-stat .number {
             color: #c60b1e;
-        }}
-        .key-points {{
+        }
+        .key-points {
             background-color: #e8f4ff;
             padding: 15px;
             border-radius: 8px;
             margin: 15px 0;
-        }}
-        .key-points h3 {{
+        }
+        .key-points h3 {
             margin-bottom: 10px;
             color: #2b6ca3;
-        }}
-        .key-points ul {{
+        }
+        .key-points ul {
             padding-left: 20px;
-        }}
-        .key-points li {{
+        }
+        .key-points li {
             margin-bottom: 8px;
-        }}
-        .risk-tag {{
+        }
+        .risk-tag {
             display: inline-block;
             padding: 5px 12px;
             border-radius: 20px;
             font-size: 0.85rem;
             font-weight: 600;
             margin-top: 10px;
-        }}
-        .risk-low {{
+        }
+        .risk-low {
             background-color: #d4edda;
             color: #155724;
-        }}
-        .risk-moderate {{
+        }
+        .risk-moderate {
             background-color: #fff3cd;
             color: #856404;
-        }}
-        .risk-high {{
+        }
+        .risk-high {
             background-color: #f8d7da;
             color: #721c24;
-        }}
-        .full-width {{
+        }
+        .full-width {
             grid-column: 1 / -1;
-        }}
-        .footer {{
+        }
+        .footer {
             text-align: center;
             margin-top: 30px;
             padding-top: 20px;
             border-top: 1px solid #eaeaea;
             color: #666;
             font-size: 0.9rem;
-        }}
-        .topic-list {{
+        }
+        .topic-list {
             list-style-type: none;
-        }}
-        .topic-list li {{
+        }
+        .topic-list li {
             padding: 8px 0;
             border-bottom: 1px solid #f0f0f0;
-        }}
-        .topic-list li:last-child {{
+        }
+        .topic-list li:last-child {
             border-bottom: none;
-        }}
-        .pdf-button {{
+        }
+        .pdf-button {
             display: inline-block;
             background: #0b5cab;
             color: white;  /* CAMBIADO: de #0b5cab a white para mejor contraste */
@@ -518,8 +285,8 @@ class WeeklyReportAgent:
             border-radius: 8px;
             font-weight: 700;
             margin: 10px 0;
-        }}
-        .update-badge {{
+        }
+        .update-badge {
             display: inline-block;
             background: #ff6b6b;
             color: white;
@@ -528,40 +295,40 @@ class WeeklyReportAgent:
             font-size: 0.7rem;
             margin-left: 8px;
             vertical-align: middle;
-        }}
+        }
     </style>
 </head>
 <body>
     <div class="header">
         <h1>Resumen Semanal de Amenazas de Enfermedades Transmisibles</h1>
         <div class="subtitle">Centro Europeo para la Prevención y el Control de Enfermedades (ECDC)</div>
-        <div class="week">Semana {report_data['week']}: {report_data['fecha_semana']}</div>
+        <div class="week">Semana $week: $fecha_semana</div>
     </div>
 
     <div class="container">
         <div class="card full-width">
             <h2>Resumen Ejecutivo</h2>
-            <p>{report_data['resumen_ejecutivo']}</p>
-            <a href="{pdf_url}" class="pdf-button">📄 Abrir Informe Completo (PDF)</a>
+            <p>$resumen_ejecutivo</p>
+            <a href="$pdf_url" class="pdf-button">📄 Abrir Informe Completo (PDF)</a>
         </div>
 
         <div class="card spain-card full-width">
             <h2>Datos Destacados para España</h2>
             <div class="stat-grid">
                 <div class="stat-box spain-stat">
-                    <div class="number">{report_data['espana_cchf_acumulado']}</div>
+                    <div class="number">$espana_cchf_acumulado</div>
                     <div class="label">Casos de Fiebre Hemorrágica de Crimea-Congo (acumulado 2025)</div>
                 </div>
                 <div class="stat-box spain-stat">
-                    <div class="number">{report_data['espana_cchf_nuevos']}</div>
+                    <div class="number">$espana_cchf_nuevos</div>
                     <div class="label">Nuevos casos de CCHF esta semana</div>
                 </div>
                 <div class="stat-box spain-stat">
-                    <div class="number">{report_data['espana_paises_wnv']}</div>
+                    <div class="number">$espana_paises_wnv</div>
                     <div class="label">Países europeos con WNV (España incluida)</div>
                 </div>
                 <div class="stat-box spain-stat">
-                    <div class="number">{report_data['espana_dengue_casos']}</div>
+                    <div class="number">$espana_dengue_casos</div>
                     <div class="label">Casos de dengue reportados</div>
                 </div>
             </div>
@@ -572,10 +339,10 @@ class WeeklyReportAgent:
             <div class="key-points">
                 <h3>Puntos Clave (Semana 37):</h3>
                 <ul>
-                    <li>Positividad de SARS-CoV-2 en atención primaria: <strong>{report_data['respiratorios_sars_primaria']}</strong></li>
-                    <li>Positividad de SARS-CoV-2 en hospitalarios: <strong>{report_data['respiratorios_sars_hospitalarios']}</strong></li>
-                    <li>Actividad de influenza: <strong>{report_data['respiratorios_influenza']}</strong> en atención primaria</li>
-                    <li>Actividad de VRS: <strong>{report_data['respiratorios_vrs']}</strong> en atención primaria</li>
+                    <li>Positividad de SARS-CoV-2 en atención primaria: <strong>$respiratorios_sars_primaria</strong></li>
+                    <li>Positividad de SARS-CoV-2 en hospitalarios: <strong>$respiratorios_sars_hospitalarios</strong></li>
+                    <li>Actividad de influenza: <strong>$respiratorios_influenza</strong> en atención primaria</li>
+                    <li>Actividad de VRS: <strong>$respiratorios_vrs</strong> en atención primaria</li>
                 </ul>
             </div>
             <p><strong>Tendencia:</strong> Circulación generalizada de SARS-CoV-2 con impacto limitado en hospitalizaciones.</p>
@@ -587,12 +354,12 @@ class WeeklyReportAgent:
             <div class="key-points">
                 <h3>Datos Europeos (hasta 17 septiembre):</h3>
                 <ul>
-                    <li><strong>{report_data['wnv_paises']} países</strong> reportando casos humanos</li>
-                    <li><strong>{report_data['wnv_areas']} áreas</strong> actualmente afectadas</li>
+                    <li><strong>$wnv_paises países</strong> reportando casos humanos</li>
+                    <li><strong>$wnv_areas áreas</strong> actualmente afectadas</li>
                     <li>Países: Albania, Bulgaria, Francia, Grecia, Hungría, Italia, Kosovo, Rumanía, Serbia, <strong>España</strong>, Turquía</li>
                 </ul>
             </div>
-            <p><strong>Expansión:</strong> Aumento a {report_data['wnv_paises']} países respecto a la semana anterior.</p>
+            <p><strong>Expansión:</strong> Aumento a $wnv_paises países respecto a la semana anterior.</p>
             <div class="risk-tag risk-low">EXPANSIÓN ESTACIONAL</div>
         </div>
 
@@ -601,9 +368,9 @@ class WeeklyReportAgent:
             <div class="key-points">
                 <h3>Situación Actual:</h3>
                 <ul>
-                    <li><strong>España: {report_data['cchf_espana_casos']} casos</strong> (acumulado 2025)</li>
-                    <li>Grecia: {report_data['cchf_grecia_casos']} casos (acumulado 2025)</li>
-                    <li><strong>{report_data['cchf_nuevos_casos']} nuevos casos</strong> reportados esta semana</li>
+                    <li><strong>España: $cchf_espana_casos casos</strong> (acumulado 2025)</li>
+                    <li>Grecia: $cchf_grecia_casos casos (acumulado 2025)</li>
+                    <li><strong>$cchf_nuevos_casos nuevos casos</strong> reportados esta semana</li>
                 </ul>
             </div>
             <p>Los casos en España no son inesperados dada la circulación conocida del virus en animales en las provincias de Salamanca y Toledo.</p>
@@ -615,10 +382,10 @@ class WeeklyReportAgent:
             <div class="key-points">
                 <h3>Casos Autóctonos (2025):</h3>
                 <ul>
-                    <li>Francia: <strong>{report_data['dengue_francia']} casos</strong></li>
-                    <li>Italia: <strong>{report_data['dengue_italia']} casos</strong></li>
-                    <li>Portugal: <strong>{report_data['dengue_portugal']} casos</strong></li>
-                    <li><strong>{report_data['dengue_clusters']} clusters activos</strong> en Francia</li>
+                    <li>Francia: <strong>$dengue_francia casos</strong></li>
+                    <li>Italia: <strong>$dengue_italia casos</strong></li>
+                    <li>Portugal: <strong>$dengue_portugal casos</strong></li>
+                    <li><strong>$dengue_clusters clusters activos</strong> en Francia</li>
                 </ul>
             </div>
             <p><strong>España:</strong> Sin casos reportados esta semana.</p>
@@ -629,20 +396,20 @@ class WeeklyReportAgent:
             <h2>Chikungunya en Europa</h2>
             <div class="stat-grid">
                 <div class="stat-box">
-                    <div class="number">{report_data['chikungunya_francia_casos']}</div>
+                    <div class="number">$chikungunya_francia_casos</div>
                     <div class="label">Casos Francia <span class="update-badge">+97</span></div>
                 </div>
                 <div class="stat-box">
-                    <div class="number">{report_data['chikungunya_italia_casos']}</div>
+                    <div class="number">$chikungunya_italia_casos</div>
                     <div class="label">Casos Italia <span class="update-badge">+38</span></div>
                 </div>
                 <div class="stat-box">
-                    <div class="number">{report_data['chikungunya_francia_clusters']}</div>
-                    <div class="label">Clusters Francia ({report_data['chikungunya_clusters_activos_francia']} activos)</div>
+                    <div class="number">$chikungunya_francia_clusters</div>
+                    <div class="label">Clusters Francia ($chikungunya_clusters_activos_francia activos)</div>
                 </div>
                 <div class="stat-box">
-                    <div class="number">{report_data['chikungunya_italia_clusters']}</div>
-                    <div class="label">Clusters Italia ({report_data['chikungunya_clusters_activos_italia']} activos)</div>
+                    <div class="number">$chikungunya_italia_clusters</div>
+                    <div class="label">Clusters Italia ($chikungunya_clusters_activos_italia activos)</div>
                 </div>
             </div>
             <div class="risk-tag risk-low">TRANSMISIÓN LOCAL ACTIVA</div>
@@ -653,10 +420,10 @@ class WeeklyReportAgent:
             <div class="key-points">
                 <h3>Actualización del Brote:</h3>
                 <ul>
-                    <li><strong>{report_data['ebola_casos_total']} casos</strong> ({report_data['ebola_confirmados']} confirmados, {report_data['ebola_probables']} probables)</li>
-                    <li><strong>{report_data['ebola_muertes']} muertes</strong> (Tasa de letalidad: {report_data['ebola_letalidad']})</li>
-                    <li><strong>{report_data['ebola_vacunados']} personas</strong> vacunadas</li>
-                    <li><strong>{report_data['ebola_contactos']}+ contactos</strong> identificados y seguidos</li>
+                    <li><strong>$ebola_casos_total casos</strong> ($ebola_confirmados confirmados, $ebola_probables probables)</li>
+                    <li><strong>$ebola_muertes muertes</strong> (Tasa de letalidad: $ebola_letalidad)</li>
+                    <li><strong>$ebola_vacunados personas</strong> vacunadas</li>
+                    <li><strong>$ebola_contactos+ contactos</strong> identificados y seguidos</li>
                 </ul>
             </div>
             <p>Todos los casos confirmados se reportan de la Zona de Salud de Bulape, Provincia de Kasai.</p>
@@ -694,10 +461,10 @@ class WeeklyReportAgent:
         <div class="card full-width">
             <h2>Resumen de Alertas y Monitoreo Activo</h2>
             <ul class="topic-list">
-                <li><strong>Ébola RDC:</strong> Brote activo con {report_data['ebola_casos_total']} casos - vigilancia intensiva en curso</li>
+                <li><strong>Ébola RDC:</strong> Brote activo con $ebola_casos_total casos - vigilancia intensiva en curso</li>
                 <li><strong>Rabia Bangkok:</strong> Alerta local - prohibición de movimiento animal por 30 días</li>
                 <li><strong>Virus Nipah Bangladesh:</strong> 4 muertes - vigilancia activa de contactos</li>
-                <li><strong>WNV Europa:</strong> Expansión a {report_data['wnv_paises']} países - {report_data['wnv_areas']} áreas afectadas</li>
+                <li><strong>WNV Europa:</strong> Expansión a $wnv_paises países - $wnv_areas áreas afectadas</li>
                 <li><strong>Fiebre Crimea-Congo:</strong> Situación estable - sin nuevos casos esta semana</li>
                 <li><strong>Dengue/Chikungunya:</strong> Transmisión local activa en Francia e Italia</li>
                 <li><strong>Virus Respiratorios:</strong> Circulación de SARS-CoV-2 con impacto limitado</li>
@@ -706,12 +473,501 @@ class WeeklyReportAgent:
     </div>
 
     <div class="footer">
-        <p>Resumen generado el: {fecha_generacion}</p>
-        <p>Fuente: ECDC Weekly Communicable Disease Threats Report, Week {report_data['week']}, {report_data['fecha_semana']}</p>
+        <p>Resumen generado el: $fecha_generacion</p>
+        <p>Fuente: ECDC Weekly Communicable Disease Threats Report, Week $week, $fecha_semana</p>
         <p>Este es un resumen automático. Para información detallada, consulte el informe completo.</p>
     </div>
 </body>
-</html>"""
+</html>""")
+
+
+# =====================================================================
+# Agente con tu formato EXACTO
+# =====================================================================
+
+class WeeklyReportAgent:
+    # Patrones de semana/año compilados una sola vez
+    _RE_WEEK = re.compile(r"\bweek[\s\-]?(\d{1,2})\b", re.I)
+    _RE_YEAR = re.compile(r"\b(20\d{2})\b")
+
+    # href de los artículos CDTR en el HTML crudo del listado
+    _RE_LISTING_LINK = re.compile(
+        rb"""href\s*=\s*["']([^"']*communicable-disease-threats-report[^"']*)["']""", re.I
+    )
+    # Secciones del sitio donde se publican los artículos CDTR
+    _LISTING_PATHS = ("/publications-data/", "/publications-and-data/")
+
+    # Enfermedades y países buscados en cada frase: una sola alternancia con
+    # grupos con nombre, de modo que cada frase se recorre una única vez
+    _RE_TOPIC = re.compile(
+        r"(?P<respiratory>sars-cov-2|covid|influenza|rsv)"
+        r"|(?P<wnv>west nile|wnv)"
+        r"|(?P<cchf>crimean-congo|cchf)"
+        r"|(?P<spain>spain|espa)"
+        r"|(?P<greece>greece|grecia)",
+        re.I,
+    )
+
+    # Cifras dentro de una frase
+    _RE_PERCENT = re.compile(r"(\d+\.?\d*%)")
+    _RE_INT = re.compile(r"\b(\d+)\b")
+
+    def __init__(self, cfg: Config) -> None:
+        self.cfg = cfg
+        logging.basicConfig(
+            level=getattr(logging, cfg.log_level.upper(), logging.INFO),
+            format="%(asctime)s %(levelname)s %(message)s"
+        )
+        self.session = requests.Session()
+        self.session.headers.update({
+            "User-Agent": (
+                "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+                "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+            ),
+            "Accept": "text/html,application/xhtml+xml,application/pdf,*/*;q=0.8",
+        })
+        # Pool keep-alive dimensionado para las descargas en paralelo y
+        # reintentos ante errores de conexión/5xx transitorios
+        retry = Retry(total=4, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                      allowed_methods=("GET", "HEAD"), raise_on_status=False)
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=ARTICLE_WORKERS, max_retries=retry))
+        # Contexto TLS para SMTP: se crea al primer envío real y se reutiliza
+        self._ssl_ctx: Optional[ssl.SSLContext] = None
+
+    # --------------------------------------------------------------
+    # Localización del artículo y PDF
+    # --------------------------------------------------------------
+    def _parse_week_year(self, text: str) -> Tuple[Optional[int], Optional[int]]:
+        s = unquote(text or "")
+        w = self._RE_WEEK.search(s)
+        # Un informe que cruza el año ("30-december-2024-5-january-2025-week-1")
+        # pertenece al año mayor, no al primero que aparece en el texto
+        years = self._RE_YEAR.findall(s)
+        return (int(w.group(1)) if w else None,
+                max(int(y) for y in years) if years else None)
+
+    def _candidate_rank(self, url: str) -> Tuple[int, int]:
+        """Clave (año, semana) de un enlace del listado; (0, 0) si no la indica."""
+        week, year = self._parse_week_year(url)
+        return (year, week) if week and year else (0, 0)
+
+    def fetch_latest_article_and_pdf(self) -> Tuple[str, str, Optional[int], Optional[int]]:
+        """Devuelve (article_url, pdf_url, week, year)."""
+        # GET condicional del listado: si no ha cambiado (304) reutilizamos
+        # el último resultado guardado y no se descarga ningún artículo
+        listing = self._load_state().get("listing") or {}
+        headers = {}
+        if listing.get("result"):
+            if listing.get("etag"):
+                headers["If-None-Match"] = listing["etag"]
+            if listing.get("last_modified"):
+                headers["If-Modified-Since"] = listing["last_modified"]
+        r = self.session.get(self.cfg.list_url, timeout=30, headers=headers)
+        if r.status_code == 304 and listing.get("result"):
+            logging.info("Listado CDTR sin cambios (304); se reutiliza el último resultado.")
+            article_url, pdf_url, week, year = listing["result"]
+            return article_url, pdf_url, week, year
+        r.raise_for_status()
+
+        # Candidatos: enlaces a "communicable-disease-threats-report-...-week-XX",
+        # buscados directamente sobre los bytes (sin construir el DOM del listado)
+        candidates: List[str] = []
+        for m in self._RE_LISTING_LINK.finditer(r.content):
+            href = unescape(m.group(1).decode("utf-8", "replace")).strip()
+            # La expresión ya garantiza el slug CDTR; solo falta la sección
+            l = href.lower()
+            if any(p in l for p in self._LISTING_PATHS):
+                url = href if href.startswith("http") else urljoin("https://www.ecdc.europa.eu", href)
+                candidates.append(url)
+
+        if not candidates:
+            raise RuntimeError("No se encontraron artículos CDTR en la página de listados.")
+
+        # Sin duplicados (el listado repite enlaces), conservando el orden
+        candidates = list(dict.fromkeys(candidates))
+
+        # Ordenamos por (año, semana) leídos del propio enlace, para que el
+        # primer bloque descargado sea ya el informe más reciente; los enlaces
+        # sin semana/año van al final en su orden de aparición (orden estable)
+        candidates.sort(key=self._candidate_rank, reverse=True)
+
+        # Descargamos cada bloque de artículos en paralelo y los examinamos
+        # en ese orden
+        with ThreadPoolExecutor(max_workers=ARTICLE_WORKERS) as ex:
+            for i in range(0, len(candidates), ARTICLE_WORKERS):
+                batch = candidates[i:i + ARTICLE_WORKERS]
+                responses = ex.map(lambda u: self.session.get(u, timeout=30), batch)
+                for article_url, ar in zip(batch, responses):
+                    if ar.status_code != 200:
+                        continue
+                    found = self._pdf_from_article(article_url, ar.text)
+                    if found:
+                        self._save_listing(r.headers.get("ETag"), r.headers.get("Last-Modified"), found)
+                        return found
+
+        raise RuntimeError("No se logró localizar un PDF dentro de los artículos candidatos.")
+
+    def _pdf_from_article(self, article_url: str, html_text: str) -> Optional[Tuple[str, str, Optional[int], Optional[int]]]:
+        atree = LexborHTMLParser(html_text)
+
+        # En el artículo suele existir un enlace directo a PDF: el primero que
+        # termina en .pdf (sin distinguir mayúsculas); si no hay ninguno, el
+        # primero que contiene ".pdf" (espacios codificados u otros sufijos)
+        pdf_href = fallback_href = None
+        for a in atree.css("a[href]"):
+            href = a.attributes.get("href") or ""
+            l = href.lower()
+            if l.endswith(".pdf"):
+                pdf_href = href
+                break
+            if fallback_href is None and ".pdf" in l:
+                fallback_href = href
+        pdf_url = (pdf_href or fallback_href or "").strip()
+        if not pdf_url:
+            return None
+
+        if not pdf_url.startswith("http"):
+            pdf_url = urljoin(article_url, pdf_url)
+
+        # Semana/año
+        title = atree.css_first("title")
+        t = (title.text(strip=True) if title else "") + " " + pdf_url
+        week, year = self._parse_week_year(t)
+        logging.info("Artículo CDTR: %s", article_url)
+        logging.info("PDF CDTR: %s (semana=%s, año=%s)", pdf_url, week, year)
+        return article_url, pdf_url, week, year
+
+    # --------------------------------------------------------------
+    # Estado (para no reenviar el mismo PDF)
+    # --------------------------------------------------------------
+    def _load_state(self) -> Dict:
+        # Un único open(): si no existe, FileNotFoundError cae en el except
+        try:
+            with open(self.cfg.state_file, "rb") as f:
+                return json.loads(f.read())
+        except Exception:
+            return {}
+
+    def _write_state(self, state: Dict) -> None:
+        # Escritura atómica: un fallo a mitad no deja el estado truncado
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.cfg.state_file)),
+                                        suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.cfg.state_file)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _save_state(self, pdf_url: str, validators: Optional[Dict[str, str]] = None,
+                    digest: str = "") -> None:
+        state = self._load_state()
+        validators = validators or {}
+        state.update({
+            "last_pdf_url": pdf_url,
+            "ts": dt.datetime.utcnow().isoformat(),
+            # ETag/Last-Modified del PDF enviado, para revalidarlo con un GET condicional
+            "etag": validators.get("etag", ""),
+            "last_modified": validators.get("last_modified", ""),
+            # SHA-256 del PDF enviado: decide si un 200 trae contenido realmente nuevo
+            "sha256": digest,
+        })
+        self._write_state(state)
+
+    def _save_listing(self, etag: Optional[str], last_modified: Optional[str],
+                      result: Tuple[str, str, Optional[int], Optional[int]]) -> None:
+        # Sin validadores no hay GET condicional posible, y en DRY_RUN no se
+        # escribe estado: no guardamos nada
+        if self.cfg.dry_run or not (etag or last_modified):
+            return
+        state = self._load_state()
+        listing = {"etag": etag or "", "last_modified": last_modified or "", "result": list(result)}
+        # Mismo listado que el ya guardado: no reescribimos el fichero
+        if state.get("listing") == listing:
+            return
+        state["listing"] = listing
+        try:
+            self._write_state(state)
+        except OSError as e:
+            logging.warning("No se pudo guardar la caché del listado: %s", e)
+
+    # --------------------------------------------------------------
+    # Descarga y extracción de texto del PDF
+    # --------------------------------------------------------------
+    def _download_pdf(self, pdf_url: str, etag: Optional[str] = None,
+                      last_modified: Optional[str] = None) -> Tuple[str, Dict[str, str]]:
+        """Descarga el PDF; devuelve (ruta temporal, validadores HTTP de la respuesta)."""
+        # GET condicional si ya conocemos la versión enviada
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        # Volcado directo del socket al fichero en bloques de 256 KiB
+        with self.session.get(pdf_url, timeout=60, stream=True, headers=headers) as r:
+            if r.status_code == 304:
+                raise PdfNotModified(pdf_url)
+            r.raise_for_status()
+            # Chequeo de tamaño con las cabeceras del propio GET (sin HEAD previo)
+            clen = r.headers.get("Content-Length")
+            if clen and clen.isdigit() and int(clen) > self.cfg.max_pdf_mb * 1024 * 1024:
+                raise RuntimeError(f"El PDF excede {self.cfg.max_pdf_mb} MB.")
+            validators = {k: v for k, v in (("etag", r.headers.get("ETag")),
+                                            ("last_modified", r.headers.get("Last-Modified"))) if v}
+            r.raw.decode_content = True
+            # Firma del fichero antes de escribir nada a disco
+            header = r.raw.read(8)
+            if not header.startswith(b"%PDF"):
+                raise RuntimeError(f"La respuesta no es un PDF: {pdf_url}")
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as f:
+                f.write(header)
+                shutil.copyfileobj(r.raw, f, 1 << 18)
+        return f.name, validators
+
+    def _extract_text_pdf(self, path: str) -> str:
+        # 1) PyMuPDF (motor C, mucho más rápido que pdfminer)
+        #    (se importa como "pymupdf": el alias "fitz" está obsoleto)
+        pymupdf = _optional_import("pymupdf")
+        if pymupdf is not None:
+            try:
+                with pymupdf.open(path) as doc:
+                    text = [clean_spaces(p.get_text("text")) for p in doc]
+                return "\n".join(t for t in text if t)
+            except Exception as e:
+                logging.warning("PyMuPDF falló: %s", e)
+
+        # 2) pypdfium2 (PDFium, también en C) si PyMuPDF no está disponible
+        pdfium = _optional_import("pypdfium2")
+        if pdfium is not None:
+            try:
+                pdf = pdfium.PdfDocument(path)
+                try:
+                    text = []
+                    for page in pdf:
+                        try:
+                            textpage = page.get_textpage()
+                            try:
+                                text.append(clean_spaces(textpage.get_text_bounded()))
+                            finally:
+                                textpage.close()
+                        finally:
+                            page.close()
+                finally:
+                    pdf.close()
+                return "\n".join(t for t in text if t)
+            except Exception as e:
+                logging.warning("pypdfium2 falló: %s", e)
+
+        # 3) pdfplumber (si está); es Python puro, así que repartimos las
+        #    páginas entre procesos cuando el documento es largo
+        pdfplumber = _optional_import("pdfplumber")
+        if pdfplumber is not None:
+            try:
+                with pdfplumber.open(path) as pdf:
+                    n_pages = len(pdf.pages)
+                workers = min(PDF_WORKERS, os.cpu_count() or 1)
+                if n_pages >= PDF_PARALLEL_MIN_PAGES and workers > 1:
+                    step = -(-n_pages // workers)
+                    starts = list(range(0, n_pages, step))
+                    stops = [min(st + step, n_pages) for st in starts]
+                    with ProcessPoolExecutor(max_workers=len(starts)) as ex:
+                        chunks = ex.map(_pdfplumber_pages, [path] * len(starts), starts, stops)
+                        text = [t for chunk in chunks for t in chunk]
+                else:
+                    text = _pdfplumber_pages(path, 0, n_pages)
+                return "\n".join(t for t in text if t.strip())
+            except Exception as e:
+                logging.warning("pdfplumber falló: %s", e)
+
+        # 4) PyPDF2
+        pypdf2 = _optional_import("PyPDF2")
+        if pypdf2 is not None:
+            try:
+                reader = pypdf2.PdfReader(path)
+                parts = []
+                for page in reader.pages:
+                    try:
+                        txt = page.extract_text() or ""
+                    except Exception:
+                        txt = ""
+                    if txt:
+                        parts.append(clean_spaces(txt.replace("\n", " ")))
+                return "\n".join(parts)
+            except Exception as e:
+                logging.warning("PyPDF2 falló: %s", e)
+
+        return ""
+
+    # --------------------------------------------------------------
+    # Caché del texto extraído (clave: SHA-256 del PDF)
+    # --------------------------------------------------------------
+    def _pdf_digest(self, path: str) -> str:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    def _extract_text_cached(self, path: str, digest: Optional[str] = None) -> str:
+        digest = digest or self._pdf_digest(path)
+        cache_path = os.path.join(self.cfg.cache_dir, f"{digest}.txt")
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                logging.info("Texto del PDF recuperado de la caché (%s).", digest[:12])
+                return f.read()
+        except OSError:
+            pass
+
+        text = self._extract_text_pdf(path)
+        if not text:
+            return text
+
+        # Escritura atómica y poda de las entradas más antiguas
+        try:
+            os.makedirs(self.cfg.cache_dir, exist_ok=True)
+            tmp_path = cache_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, cache_path)
+            entries = sorted(
+                (os.path.join(self.cfg.cache_dir, n) for n in os.listdir(self.cfg.cache_dir) if n.endswith(".txt")),
+                key=os.path.getmtime, reverse=True,
+            )
+            for old in entries[self.cfg.cache_max_entries:]:
+                os.remove(old)
+        except OSError as e:
+            logging.warning("No se pudo guardar el texto en caché: %s", e)
+        return text
+
+    # --------------------------------------------------------------
+    # Extracción de datos específicos
+    # --------------------------------------------------------------
+    def extract_report_data(self, text: str, week: Optional[int], year: Optional[int]) -> Dict[str, Any]:
+        """Extrae datos específicos manteniendo la estructura de tu ejemplo"""
+        # Valores por defecto basados en tu ejemplo exacto
+        data = {
+            # Metadatos
+            "week": week or 38,
+            "year": year or 2025,
+            "fecha_semana": f"13-19 Septiembre {year or 2025}",
+            "fecha_generacion": fecha_es(dt.datetime.utcnow()),
+            
+            # Resumen ejecutivo (se intentará extraer del PDF)
+            "resumen_ejecutivo": "Continúa la circulación generalizada de SARS-CoV-2 en la UE/EEA con impacto limitado en hospitalizaciones. Los virus respiratorios estacionales (VRS e influenza) se mantienen en niveles muy bajos. Se reportan avances en el brote de Ébola en República Democrática del Congo y alertas por rabia en Bangkok y virus Nipah en Bangladesh.",
+            
+            # Datos de España
+            "espana_cchf_acumulado": 3,
+            "espana_cchf_nuevos": 0,
+            "espana_paises_wnv": 11,
+            "espana_dengue_casos": 0,
+            
+            # Virus Respiratorios
+            "respiratorios_sars_primaria": "13%",
+            "respiratorios_sars_hospitalarios": "11%",
+            "respiratorios_influenza": "1.4%",
+            "respiratorios_vrs": "0%",
+            
+            # WNV
+            "wnv_paises": 11,
+            "wnv_areas": 120,
+            
+            # CCHF
+            "cchf_espana_casos": 3,
+            "cchf_grecia_casos": 2,
+            "cchf_nuevos_casos": 0,
+            
+            # Dengue
+            "dengue_francia": 21,
+            "dengue_italia": 4,
+            "dengue_portugal": 2,
+            "dengue_clusters": 4,
+            
+            # Chikungunya
+            "chikungunya_francia_casos": 480,
+            "chikungunya_italia_casos": 205,
+            "chikungunya_francia_clusters": 53,
+            "chikungunya_italia_clusters": 4,
+            "chikungunya_clusters_activos_francia": 38,
+            "chikungunya_clusters_activos_italia": 3,
+            
+            # Ébola
+            "ebola_casos_total": 48,
+            "ebola_confirmados": 38,
+            "ebola_probables": 10,
+            "ebola_muertes": 31,
+            "ebola_letalidad": "64.6%",
+            "ebola_vacunados": 591,
+            "ebola_contactos": 900,
+        }
+        
+        # Intenta extraer datos reales del texto si está disponible
+        if text:
+            # Búsqueda de patrones específicos
+            for sentence in self._iter_sentences(text):
+                topics = {m.lastgroup for m in self._RE_TOPIC.finditer(sentence)}
+                if not topics.intersection(("respiratory", "wnv", "cchf")):
+                    continue
+                # Enteros de la frase: se tokenizan una vez para WNV y CCHF
+                numbers = self._RE_INT.findall(sentence) if ("wnv" in topics or "cchf" in topics) else []
+
+                # Buscar porcentajes para respiratorios
+                if "respiratory" in topics:
+                    percentages = self._RE_PERCENT.findall(sentence)
+                    if percentages:
+                        if len(percentages) >= 4:
+                            data.update({
+                                "respiratorios_sars_primaria": percentages[0],
+                                "respiratorios_sars_hospitalarios": percentages[1],
+                                "respiratorios_influenza": percentages[2],
+                                "respiratorios_vrs": percentages[3]
+                            })
+                
+                # Buscar números para WNV
+                if "wnv" in topics:
+                    if numbers and len(numbers) >= 2:
+                        data.update({
+                            "wnv_paises": int(numbers[0]),
+                            "wnv_areas": int(numbers[1])
+                        })
+                
+                # Buscar números para CCHF
+                if "cchf" in topics:
+                    if numbers:
+                        if "spain" in topics:
+                            data["cchf_espana_casos"] = int(numbers[0]) if numbers else 3
+                        elif "greece" in topics:
+                            data["cchf_grecia_casos"] = int(numbers[0]) if numbers else 2
+        
+        return data
+
+    def _iter_sentences(self, text: str) -> Iterator[str]:
+        # Recorremos los cortes sobre el texto normalizado sin materializar
+        # la lista de frases (los trozos ya salen sin espacios sobrantes)
+        raw = clean_spaces(text)
+        start = 0
+        for m in _RE_SENT_BOUNDARY.finditer(raw):
+            yield raw[start:m.start()]
+            start = m.end()
+        if start < len(raw):
+            yield raw[start:]
+
+    # --------------------------------------------------------------
+    # TU FORMATO EXACTO - HTML IDÉNTICO AL QUE ME DISTE
+    # --------------------------------------------------------------
+    def build_html(self, week: Optional[int], year: Optional[int],
+                   pdf_url: str, article_url: str,
+                   report_data: Dict[str, Any]) -> str:
+
+        # Valores escapados: los datos pueden venir del texto del PDF.
+        # La fecha de generación ya viene calculada en report_data.
+        values = {k: escape(str(v)) for k, v in report_data.items()}
+        values["pdf_url"] = escape(pdf_url)
+        if "fecha_generacion" not in values:
+            values["fecha_generacion"] = fecha_es(dt.datetime.utcnow())
+
+        html_content = HTML_TEMPLATE.substitute(values)
 
         return html_content
 
@@ -725,41 +981,51 @@ class WeeklyReportAgent:
         emails = [e.strip() for e in s.split(",") if e.strip()]
         return emails
 
-    def send_email(self, subject: str, html: str) -> None:
+    def _check_email_config(self) -> List[str]:
+        """Valida la configuración SMTP; devuelve la lista de destinatarios."""
         to_addrs = self._parse_recipients(self.cfg.receiver_email)
         if not self.cfg.sender_email or not to_addrs:
             raise ValueError("Faltan SENDER_EMAIL o RECEIVER_EMAIL.")
         if not self.cfg.smtp_server:
             raise ValueError("Falta SMTP_SERVER.")
+        return to_addrs
 
-        msg = MIMEMultipart('alternative')
+    def send_email(self, subject: str, html: str) -> None:
+        to_addrs = self._check_email_config()
+
+        msg = EmailMessage(policy=SMTP_POLICY)
         msg['Subject'] = subject
         msg['From'] = self.cfg.sender_email
         msg['To'] = ", ".join(to_addrs)
+        msg.set_content(html, subtype='html', charset='utf-8', cte='base64')
 
-        msg.attach(MIMEText(html, 'html', 'utf-8'))
+        # Serializamos una sola vez (CRLF ya aplicado por la política SMTP)
+        payload = msg.as_bytes()
 
         logging.info("SMTP: from=%s → to=%s", self.cfg.sender_email, to_addrs)
-        ctx = ssl.create_default_context()
 
         if self.cfg.dry_run:
             logging.info("DRY_RUN=1: no se envía (asunto: %s).", subject)
             return
 
+        # La carga de certificados del sistema solo se paga una vez
+        if self._ssl_ctx is None:
+            self._ssl_ctx = ssl.create_default_context()
+        ctx = self._ssl_ctx
+
         if int(self.cfg.smtp_port) == 465:
+            # smtplib hace EHLO de forma perezosa en login/sendmail
             with smtplib.SMTP_SSL(self.cfg.smtp_server, self.cfg.smtp_port, context=ctx, timeout=30) as s:
-                s.ehlo()
                 if self.cfg.email_password:
                     s.login(self.cfg.sender_email, self.cfg.email_password)
-                s.sendmail(self.cfg.sender_email, to_addrs, msg.as_string())
+                s.sendmail(self.cfg.sender_email, to_addrs, payload)
         else:
             with smtplib.SMTP(self.cfg.smtp_server, self.cfg.smtp_port, timeout=30) as s:
                 s.ehlo()
                 s.starttls(context=ctx)
-                s.ehlo()
                 if self.cfg.email_password:
                     s.login(self.cfg.sender_email, self.cfg.email_password)
-                s.sendmail(self.cfg.sender_email, to_addrs, msg.as_string())
+                s.sendmail(self.cfg.sender_email, to_addrs, payload)
 
         logging.info("Correo enviado correctamente.")
 
@@ -773,29 +1039,54 @@ class WeeklyReportAgent:
             logging.exception("No se pudo localizar el CDTR más reciente: %s", e)
             return
 
-        # Anti-duplicados
+        # Anti-duplicados: misma URL sin validadores guardados → ya enviado;
+        # con ETag/Last-Modified → se revalida con un GET condicional
         state = self._load_state()
-        if state.get("last_pdf_url") == pdf_url:
+        same_url = state.get("last_pdf_url") == pdf_url
+        if same_url and not (state.get("etag") or state.get("last_modified")):
             logging.info("PDF ya enviado anteriormente, no se vuelve a enviar.")
             return
 
         # Descarga y extracción
         tmp_pdf = ""
         text = ""
+        validators: Dict[str, str] = {}
+        digest = ""
         try:
-            tmp_pdf = self._download_pdf(pdf_url)
-            text = self._extract_text_pdf(tmp_pdf)
+            if same_url:
+                tmp_pdf, validators = self._download_pdf(pdf_url, state.get("etag"), state.get("last_modified"))
+            else:
+                tmp_pdf, validators = self._download_pdf(pdf_url)
+            digest = self._pdf_digest(tmp_pdf)
+            if same_url:
+                # Hay servidores que ignoran If-None-Match o cambian de ETag
+                # entre réplicas: solo reenviamos si el contenido es distinto
+                if digest == state.get("sha256"):
+                    logging.info("PDF ya enviado anteriormente y con el mismo contenido, no se vuelve a enviar.")
+                    # Guardamos los validadores nuevos para que la próxima
+                    # revalidación pueda acabar en 304 sin descargar el PDF
+                    if not self.cfg.dry_run:
+                        self._save_state(pdf_url, validators, digest)
+                    return
+                logging.info("El PDF ya enviado ha cambiado en el servidor; se reenvía.")
+            text = self._extract_text_cached(tmp_pdf, digest)
             logging.info("PDF descargado y texto extraído exitosamente")
+        except PdfNotModified:
+            logging.info("PDF ya enviado anteriormente y sin cambios (304), no se vuelve a enviar.")
+            return
         except Exception as e:
             logging.exception("Error descargando/extrayendo el PDF: %s", e)
+            if same_url:
+                # Sin poder revalidar, no arriesgamos un reenvío duplicado
+                return
         finally:
-            if tmp_pdf and os.path.exists(tmp_pdf):
-                for _ in range(3):
-                    try:
-                        os.remove(tmp_pdf)
-                        break
-                    except Exception:
-                        time.sleep(0.2)
+            # Todos los extractores cierran el fichero antes de volver,
+            # así que basta un único borrado sin reintentos ni esperas
+            if tmp_pdf:
+                try:
+                    os.remove(tmp_pdf)
+                except OSError as e:
+                    logging.warning("No se pudo borrar el PDF temporal %s: %s", tmp_pdf, e)
 
         # Extracción de datos
         try:
@@ -805,10 +1096,23 @@ class WeeklyReportAgent:
             logging.exception("Error extrayendo datos del reporte: %s", e)
             report_data = self.extract_report_data("", week, year)
 
+        subject = f"ECDC CDTR – Semana {week if week else 'Última'} ({year or dt.date.today().year})"
+
+        # En DRY_RUN no se materializa el HTML ni se toca el estado (un ensayo
+        # no debe impedir el envío real posterior): solo validamos la
+        # configuración SMTP y registramos lo localizado
+        if self.cfg.dry_run:
+            try:
+                self._check_email_config()
+            except ValueError as e:
+                logging.error("DRY_RUN=1: configuración de correo incompleta: %s", e)
+            logging.info("DRY_RUN=1: no se genera ni envía el HTML (asunto: %s).", subject)
+            logging.info("Artículo: %s | PDF: %s", article_url, pdf_url)
+            return
+
         # HTML final con tu formato EXACTO
         try:
             html = self.build_html(week, year, pdf_url, article_url, report_data)
-            subject = f"ECDC CDTR – Semana {week if week else 'Última'} ({year or dt.date.today().year})"
             logging.info("HTML generado exitosamente con tu formato exacto")
         except Exception as e:
             logging.exception("Error generando HTML: %s", e)
@@ -817,7 +1121,7 @@ class WeeklyReportAgent:
         # Envío
         try:
             self.send_email(subject, html)
-            self._save_state(pdf_url)
+            self._save_state(pdf_url, validators, digest)
             logging.info("Reporte enviado exitosamente con tu formato exacto")
         except Exception as e:
             logging.exception("Fallo enviando el email: %s", e)